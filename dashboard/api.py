@@ -0,0 +1,300 @@
+# ----------------------------
+# Local aggregate API
+# ----------------------------
+# Small read-only HTTP service that keeps the merged HMO (+ metadata) data and its aggregates warm in memory,
+# so the Streamlit dashboard (HMO_API_URL) and other tools (Tableau / Power BI web connectors, Python, curl)
+# share one computed cache instead of each re-reading and re-aggregating the CSVs.
+#
+# Run from anywhere:
+#     python dashboard/api.py --port 8765
+#
+# Endpoints (all GET, ?format=json|arrow, default json; Arrow = IPC stream, needs pyarrow):
+#     /health
+#     /aggregates/study_counts                        unique samples per study
+#     /aggregates/secretor_composition                secretor vs non-secretor per study (comp_df)
+#     /aggregates/hmo_summary?study=A&secretor=All    HMO summary table (study repeatable)
+#     /aggregates/lactation?study=A&hmo=2FL&unit=ug/mL  derived/hmo_lactation_aggregates.csv
+#     /data?study=A&secretor=Secretor&columns=StudyID,SampleName,2FL (ug/mL)
+#                                                     filtered slice of derived/hmo_merged_with_metadata.csv
+#
+# Every response carries an ETag built from the source files' size + mtime and the request;
+# clients sending it back in If-None-Match get 304 Not Modified. Sources are re-read automatically
+# when the pipeline rewrites them.
+
+import argparse
+import hashlib
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import utils
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; JSON always works
+    pa = None
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+SOURCES = {
+    "hmo": PROJECT_ROOT / "staging" / "_merged" / "hmo_merged.csv",
+    "hmo_meta": PROJECT_ROOT / "derived" / "hmo_merged_with_metadata.csv",
+    "lactation": PROJECT_ROOT / "derived" / "hmo_lactation_aggregates.csv",
+    "matrix": PROJECT_ROOT / "derived" / "hmo_matrix" / "manifest.json",
+}
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+
+# ----------------------------
+# Warm cache
+# ----------------------------
+# tables: parsed source CSVs + the memory-mapped HMO matrix, loaded on first use
+# responses: serialized bodies keyed by (path, query, format)
+# both are dropped as soon as any source file changes on disk
+
+_cache = {"version": None, "tables": {}, "responses": {}}
+_lock = threading.Lock()
+
+
+# size + mtime of every source file -> one short version string
+def _data_version():
+    parts = []
+    for name, path in sorted(SOURCES.items()):
+        st = path.stat() if path.exists() else None
+        parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}" if st else f"{name}:missing")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+def _check_version():
+    version = _data_version()
+    with _lock:
+        if version != _cache["version"]:
+            _cache.update(version=version, tables={}, responses={})
+    return version
+
+
+def _table(name):
+    with _lock:
+        return _load_table(name)
+
+
+# caller holds _lock
+def _load_table(name):
+    tables = _cache["tables"]
+    if name not in tables:
+        path = SOURCES[name]
+        if not path.exists():
+            raise FileNotFoundError(f"{path.relative_to(PROJECT_ROOT)} not found - run the pipeline notebooks first")
+        if name == "matrix":
+            tables[name] = utils.load_hmo_matrix(path.parent)
+        else:
+            # merged HMO + metadata is read as strings (IDs must round-trip exactly), same as the notebooks
+            tables[name] = pd.read_csv(path, dtype=str if name == "hmo_meta" else None)
+    return tables[name]
+
+
+# ----------------------------
+# Endpoints: (query dict) -> DataFrame
+# ----------------------------
+
+# invalid query parameters -> 400 (anything else raised while computing is a 500)
+class BadRequest(ValueError):
+    pass
+
+
+def _first(query, key, default=None):
+    return query.get(key, [default])[0]
+
+
+# repeated ?study=A&study=B, None = all studies; unknown StudyIDs are a 400 (a typo must not look like an empty dataset)
+def _studies(query):
+    studies = query.get("study") or None
+    if studies:
+        known = set(_table("hmo")["StudyID"].dropna().astype(str))
+        unknown = sorted(set(studies) - known)
+        if unknown:
+            raise BadRequest(f"Unknown study: {unknown} (known: {sorted(known)})")
+    return studies
+
+
+SECRETOR_VALUES = ["All", "Secretor", "Non-secretor", "Unknown"]
+
+
+# repeated ?secretor=..., None = no filter ("All" = no filter too)
+def _secretors(query):
+    secretors = query.get("secretor") or None
+    if secretors:
+        bad = sorted(set(secretors) - set(SECRETOR_VALUES))
+        if bad:
+            raise BadRequest(f"Unknown secretor: {bad} (use one of {SECRETOR_VALUES})")
+    return secretors
+
+
+def _lactation(query):
+    df = _table("lactation")
+    studies = _studies(query)
+    if studies:
+        df = df[df["StudyID"].isin(studies)]
+    _secretors(query)
+    for col in ["secretor", "HMO", "unit"]:
+        value = _first(query, col.lower())
+        if value is not None:
+            df = df[df[col] == value]
+    return df
+
+
+def _data_slice(query):
+    df = _table("hmo_meta")
+    studies = _studies(query)
+    if studies:
+        df = df[df["StudyID"].isin(studies)]
+
+    secretors = _secretors(query)
+    if secretors and "All" not in secretors:
+        df = df[df["Secretor"].apply(utils.secretor_label).isin(secretors)]
+
+    columns = _first(query, "columns")
+    if columns:
+        wanted = [c.strip() for c in columns.split(",")]
+        unknown = [c for c in wanted if c not in df.columns]
+        if unknown:
+            raise BadRequest(f"Unknown column(s): {unknown}")
+        df = df[wanted]
+    return df
+
+
+def _hmo_summary(query):
+    m = _table("matrix")
+    studies = _studies(query)
+    secretor = (_secretors(query) or ["All"])[0]
+    return utils.hmo_summary(m, utils.row_mask(m, studies, secretor))
+
+
+ENDPOINTS = {
+    "/aggregates/study_counts": lambda q: utils.study_sample_counts(_table("hmo")),
+    "/aggregates/secretor_composition": lambda q: utils.secretor_composition(_table("hmo")),
+    "/aggregates/hmo_summary": _hmo_summary,
+    "/aggregates/lactation": _lactation,
+    "/data": _data_slice,
+}
+
+
+# ----------------------------
+# Serialization
+# ----------------------------
+
+def _to_json(df):
+    return df.to_json(orient="records").encode()
+
+
+def _to_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _wants_arrow(query, accept):
+    fmt = _first(query, "format")
+    if fmt is not None:
+        if fmt.lower() not in ("json", "arrow"):
+            raise BadRequest(f"Unknown format: {fmt!r} (use json or arrow)")
+        return fmt.lower() == "arrow"
+    return ARROW_MIME in (accept or "")
+
+
+# ----------------------------
+# HTTP handler
+# ----------------------------
+
+class AggregateHandler(BaseHTTPRequestHandler):
+    server_version = "HMOAggregateAPI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        version = _check_version()
+
+        if url.path == "/health":
+            return self._send(200, json.dumps({"status": "ok", "data_version": version}).encode(), "application/json")
+
+        if url.path not in ENDPOINTS:
+            return self._error(404, f"Unknown endpoint: {url.path}", ["/health"] + sorted(ENDPOINTS))
+
+        try:
+            arrow = _wants_arrow(query, self.headers.get("Accept"))
+        except BadRequest as e:
+            return self._error(400, str(e))
+        if arrow and pa is None:
+            return self._error(406, "Arrow output needs pyarrow (pip install pyarrow); use format=json")
+
+        # same data version + same request -> same cache entry + same ETag
+        key = (version, url.path, tuple(sorted((k, tuple(v)) for k, v in query.items())), arrow)
+        etag = '"' + hashlib.sha1(str(key).encode()).hexdigest()[:20] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, b"", None, etag)
+
+        with _lock:
+            cached = _cache["responses"].get(key)
+        if cached is None:
+            try:
+                df = ENDPOINTS[url.path](query)
+            except FileNotFoundError as e:
+                return self._error(503, str(e))
+            except BadRequest as e:
+                return self._error(400, str(e))
+            except Exception as e:
+                return self._error(500, f"{type(e).__name__}: {e}")
+            cached = _to_arrow(df) if arrow else _to_json(df)
+            with _lock:
+                # the data may have changed while this response was computed -> don't keep it
+                if _cache["version"] == version:
+                    _cache["responses"][key] = cached
+
+        return self._send(200, cached, ARROW_MIME if arrow else "application/json", etag)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")   # always revalidate, 304s are cheap
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, message, endpoints=None):
+        payload = {"error": message}
+        if endpoints:
+            payload["endpoints"] = endpoints
+        return self._send(status, json.dumps(payload).encode(), "application/json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only local API serving HMO aggregates and data slices.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), AggregateHandler)
+    print(f"[i] HMO aggregate API on http://{args.host}:{args.port}  (data: {PROJECT_ROOT})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
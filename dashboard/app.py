@@ -1,10 +1,13 @@
+import os
 import streamlit as st
 import pandas as pd
-import altair as alt
+import numpy as np
 from datetime import datetime
-import pydeck as pdk  
-import plotly as plt
-import plotly.express as px
+
+import utils   # shared aggregates (also served by the local aggregate API, api.py)
+
+# plotting libraries (altair, pydeck, plotly) are imported inside the page that uses them,
+# so a page only pays the import cost for the charts it actually draws
 
 
 st.set_page_config(
@@ -17,6 +20,8 @@ st.set_page_config(
 # ----------------------------
 # Load Data
 # ----------------------------
+# loaders are only called from the page that needs them (nothing is read before a page is chosen)
+# st.cache_data keeps the result after first use, so switching pages / reruns don't re-read files
 
 #merged HMO data
 @st.cache_data
@@ -24,7 +29,6 @@ def load_data():
     df = pd.read_csv("../staging/_merged/hmo_merged.csv")
     return df
 
-df = load_data()
 
 # study locations metadata - manually update this excel as new studies are added
 @st.cache_data
@@ -32,11 +36,6 @@ def load_locations():
     loc = pd.read_excel("../study extras/study_locations.xlsx")
     return loc
 
-locations = load_locations()
-
-# Merge study locations into your HMO dataframe
-df = df.merge(locations, on="StudyID", how="left")
-
 
 # study descriptions metadata - manually update this excel as new studies are added
 @st.cache_data
@@ -45,7 +44,163 @@ def load_study_descriptions():
     df_desc.columns = df_desc.columns.str.strip().str.replace(" ", "_")  # normalize names
     return df_desc
 
-study_desc = load_study_descriptions()
+
+# HMO data + study locations (only the Overview page needs Latitude / Longitude etc.)
+@st.cache_data
+def load_data_with_locations():
+    return load_data().merge(load_locations(), on="StudyID", how="left")
+
+
+# sample x HMO matrix (ug/mL) + row-aligned study / secretor / sample arrays, memory-mapped
+# (written by metadataprocessing.ipynb to derived/hmo_matrix/)
+# cache_resource shares the memmap as-is across reruns; the manifest mtime re-opens it after a pipeline run
+HMO_MATRIX_DIR = "../derived/hmo_matrix"
+
+
+@st.cache_resource
+def _open_hmo_matrix(version):
+    return utils.load_hmo_matrix(HMO_MATRIX_DIR)
+
+
+def load_hmo_matrix():
+    return _open_hmo_matrix(os.path.getmtime(os.path.join(HMO_MATRIX_DIR, "manifest.json")))
+
+
+# ----------------------------
+# Shared aggregates: local aggregate API if configured, otherwise computed here
+# ----------------------------
+# start the API with `python api.py` and set HMO_API_URL (e.g. http://127.0.0.1:8765)
+# so every dashboard instance reads from the API's one warm cache instead of re-aggregating
+HMO_API_URL = os.environ.get("HMO_API_URL")
+
+
+# params use the API's query names (e.g. study=[...], secretor="Secretor")
+@st.cache_data(ttl=60)
+def load_aggregate(name, **params):
+    # no study selected = no rows; the query string can't say that (an empty list is dropped = all studies),
+    # so empty selections are answered locally
+    no_studies = params.get("study") is not None and len(params["study"]) == 0
+
+    if HMO_API_URL and not no_studies:
+        try:
+            return utils.fetch_aggregate(HMO_API_URL, name, params)
+        except OSError:
+            pass  # API not reachable -> fall back to computing locally
+
+    if name == "study_counts":
+        return utils.study_sample_counts(load_data())
+    if name == "secretor_composition":
+        return utils.secretor_composition(load_data())
+    if name == "hmo_summary":
+        m = load_hmo_matrix()
+        return utils.hmo_summary(m, utils.row_mask(m, params.get("study"), params.get("secretor", "All")))
+    raise ValueError(f"Unknown aggregate: {name}")
+
+
+# longitudinal tables materialized by metadataprocessing.ipynb (Lactation Trends page)
+# per (study, secretor, lactation-week bin, HMO, unit) summary stats
+@st.cache_data
+def load_lactation_aggregates():
+    return pd.read_csv("../derived/hmo_lactation_aggregates.csv")
+
+
+# per-subject HMO values at each lactation week (only read if subject lines are switched on)
+@st.cache_data
+def load_lactation_trajectories():
+    return pd.read_csv("../derived/hmo_lactation_trajectories.csv")
+
+
+# ----------------------------
+# Overview aggregates + charts (built once, reused on every rerun)
+# ----------------------------
+
+# one row per study with location info and sample counts (feeds the map)
+@st.cache_data
+def load_study_summary():
+    df = load_data_with_locations()
+    study_summary = (
+        df.groupby(["StudyID", "Institution", "City", "Country", "Analyzed"])
+          .agg(
+              Latitude=("Latitude", "mean"),
+              Longitude=("Longitude", "mean"),
+              n_samples=("SampleName", "nunique"),
+          )
+          .reset_index()
+    )
+
+    study_summary["Analyzed"] = (
+        pd.to_datetime(study_summary["Analyzed"])
+          .dt.strftime("%Y-%m-%d")
+    )
+    return study_summary
+
+
+# number of unique samples per study (bar chart + "About the Studies" table)
+def load_study_counts():
+    return load_aggregate("study_counts")
+
+
+# pydeck map of study locations - cache_resource keeps the same Deck object across reruns
+# keyed on the study summary it draws, so a new summary builds a new map
+@st.cache_resource
+def build_study_map(study_summary):
+    import pydeck as pdk
+
+    mid_lat = study_summary["Latitude"].mean()
+    mid_lon = study_summary["Longitude"].mean()
+
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=study_summary,
+        get_position="[Longitude, Latitude]",
+        get_radius=200000,
+        get_fill_color=[230, 40, 20, 160],
+        pickable=True,
+    )
+
+    view_state = pdk.ViewState(
+        latitude=mid_lat,
+        longitude=mid_lon,
+        zoom=2,
+        pitch=0,
+    )
+
+    tooltip = {
+        "html": (
+            "<b>Study:</b> {StudyID}<br/>"
+            "<b>Institution:</b> {Institution}<br/>"
+            "<b>Country:</b> {Country}<br/>"
+            "<b>Samples:</b> {n_samples}<br/>"
+            "<b>Date Analyzed:</b> {Analyzed}"
+        ),
+        "style": {"backgroundColor": "white", "color": "black"},
+    }
+
+    return pdk.Deck(
+        layers=[layer],
+        initial_view_state=view_state,
+        tooltip=tooltip,
+    )
+
+
+# altair bar chart of samples per study - same idea, keyed on the counts it draws
+# (the counts refresh every 60s through load_aggregate, the chart follows them)
+@st.cache_resource
+def build_samples_bar(counts):
+    import altair as alt
+
+    ucsd_blue = "#00356B"  # official UCSD navy shade
+
+    return (
+        alt.Chart(counts)
+        .mark_bar(color=ucsd_blue)
+        .encode(
+            y=alt.Y("StudyID:N", title="Study", sort="-x"),
+            x=alt.X("n_samples:Q", title="Number of Unique Samples"),
+            tooltip=["StudyID", "n_samples"]
+        )
+        .properties(height=300)
+    )
 
 
 
@@ -63,7 +218,7 @@ st.sidebar.title("Bode Lab Dashboard")
 
 page = st.sidebar.radio(
     "Navigate",
-    ["Overview", "HMO Composition", "Statistics"],  #change page names as needed
+    ["Overview", "HMO Composition", "Lactation Trends", "Statistics"],  #change page names as needed
 )
 
 st.sidebar.markdown("### Lab Website")       # include lab website link (if wanted)
@@ -206,6 +361,10 @@ html, body, [class*="css"] {
 if page == "Overview":
     st.markdown("## Overview - Bode Lab Human Milk Oligosaccaride Studies")
 
+    # only the tables this page needs: HMO data + locations, and the study descriptions
+    df = load_data_with_locations()
+    study_desc = load_study_descriptions()
+
     # ---- compute metrics ----
     n_studies = df["StudyID"].nunique()
     n_samples = df["SampleName"].nunique()
@@ -297,60 +456,8 @@ if page == "Overview":
     # ---- existing section: Study Locations map below ----
     st.markdown("### Study Locations")
 
-
-    # ---- your existing study_summary + map code ----
-    study_summary = (
-        df.groupby(["StudyID", "Institution", "City", "Country", "Analyzed"])
-          .agg(
-              Latitude=("Latitude", "mean"),
-              Longitude=("Longitude", "mean"),
-              n_samples=("SampleName", "nunique"),
-          )
-          .reset_index()
-    )
-
-    study_summary["Analyzed"] = (
-        pd.to_datetime(study_summary["Analyzed"])
-          .dt.strftime("%Y-%m-%d")
-    )
-
-    mid_lat = study_summary["Latitude"].mean()
-    mid_lon = study_summary["Longitude"].mean()
-
-    layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=study_summary,
-        get_position="[Longitude, Latitude]",
-        get_radius=200000,
-        get_fill_color=[230, 40, 20, 160],
-        pickable=True,
-    )
-
-    view_state = pdk.ViewState(
-        latitude=mid_lat,
-        longitude=mid_lon,
-        zoom=2,
-        pitch=0,
-    )
-
-    tooltip = {
-        "html": (
-            "<b>Study:</b> {StudyID}<br/>"
-            "<b>Institution:</b> {Institution}<br/>"
-            "<b>Country:</b> {Country}<br/>"
-            "<b>Samples:</b> {n_samples}<br/>"
-            "<b>Date Analyzed:</b> {Analyzed}"
-        ),
-        "style": {"backgroundColor": "white", "color": "black"},
-    }
-
-    r = pdk.Deck(
-        layers=[layer],
-        initial_view_state=view_state,
-        tooltip=tooltip,
-    )
-
-    st.pydeck_chart(r, use_container_width=True)
+    # map is built once per study summary (see build_study_map) and reused on every rerun
+    st.pydeck_chart(build_study_map(load_study_summary()), use_container_width=True)
 
 
 
@@ -360,26 +467,7 @@ if page == "Overview":
     # --- Samples per Study bar chart ---
     st.markdown("### Number of Samples per Study")
 
-    study_counts = (
-        df.groupby("StudyID")["SampleName"]
-        .nunique()
-        .reset_index(name="n_samples")
-    )
-
-    ucsd_blue = "#00356B"  # official UCSD navy shade
-
-    bar = (
-    alt.Chart(study_counts)
-    .mark_bar(color=ucsd_blue)
-    .encode(
-        y=alt.Y("StudyID:N", title="Study", sort="-x"),
-        x=alt.X("n_samples:Q", title="Number of Unique Samples"),
-        tooltip=["StudyID", "n_samples"]
-    )
-    .properties(height=300)
-)
-
-    st.altair_chart(bar, use_container_width=True)
+    st.altair_chart(build_samples_bar(load_study_counts()), use_container_width=True)
 
 
 
@@ -395,11 +483,9 @@ if page == "Overview":
     # -------------------------
     st.markdown("### About the Studies Included")
 
-    # 1) Compute number of samples per study from main df
-    sample_counts = (
-        df.groupby("StudyID")["SampleName"]
-        .nunique()
-        .reset_index(name="num_samples")  # <-- we will use THIS name
+    # 1) Number of samples per study (same cached counts as the bar chart above)
+    sample_counts = load_study_counts().rename(
+        columns={"n_samples": "num_samples"}  # <-- we will use THIS name
     )
 
     # 2) Merge descriptions + sample counts
@@ -476,23 +562,20 @@ if page == "Overview":
 
 
 elif page == "HMO Composition":
+    import plotly.express as px
+
     st.markdown("## HMO Composition")
-    
 
-    # --- Aggregate secretor vs non-secretor per study ---
-    comp_df = (
-        df
-        .dropna(subset=["Secretor", "StudyID"])
-        .groupby("StudyID")
-        .agg(
-            n_total=("Secretor", "count"),
-            n_secretor=("Secretor", "sum")  # since 1 = secretor, 0 = non
-        )
-        .reset_index()
-    )
+    # this page works on the memory-mapped sample x HMO matrix (no long-format table unless plotting)
+    try:
+        m = load_hmo_matrix()
+    except FileNotFoundError:
+        st.info("No HMO matrix yet - run metadataprocessing.ipynb to build derived/hmo_matrix/.")
+        st.stop()
+    
 
-    comp_df["pct_secretor"] = comp_df["n_secretor"] / comp_df["n_total"]
-    comp_df["pct_non_secretor"] = 1 - comp_df["pct_secretor"]
+    # --- Aggregate secretor vs non-secretor per study (see utils.secretor_composition) ---
+    comp_df = load_aggregate("secretor_composition")
 
 
 
@@ -513,18 +596,9 @@ elif page == "HMO Composition":
 
 
     # ----------------------------
-    # 1) Identify the 19 HMO columns (use ug/mL columns from your merged file)
+    # 1) The 19 HMO columns = matrix columns (ug/mL, summary columns like SUM left out by the pipeline)
     # ----------------------------
-
-    # We want the 19 individual HMOs in ug/mL (NOT the summary columns like SUM)
-    HMO_UNIT = "(ug/mL)"
-    EXCLUDE_HMO_COLS = {f"SUM {HMO_UNIT}"}  # exclude summary column
-
-    # Auto-detect all ug/mL HMO columns, then remove excluded ones
-    HMO_COLS = [
-        c for c in df.columns
-        if HMO_UNIT in c and c not in EXCLUDE_HMO_COLS
-    ]
+    HMO_COLS = m["hmos"]
 
 
 
@@ -538,8 +612,9 @@ elif page == "HMO Composition":
         st.markdown("### Dataset Snapshot")
 
         # --- KPI values ---
-        n_samples = df["SampleName"].nunique()
-        n_studies = df["StudyID"].nunique()
+        has_study = m["study_code"] >= 0
+        n_samples = len(set(m["sample_name"][m["sample_name"] != ""]))
+        n_studies = len(np.unique(m["study_code"][has_study]))
         n_hmos = len(HMO_COLS)
 
         # --- KPI Card 1: Samples ---
@@ -610,63 +685,18 @@ elif page == "HMO Composition":
     # Sanity check
     if len(HMO_COLS) == 0:
         st.warning(
-            f"No HMO columns found for unit {HMO_UNIT}. "
-            "Check your column names (e.g., '2FL (ug/mL)') and update HMO_UNIT / EXCLUDE_HMO_COLS."
+            f"No HMO columns found for unit {utils.HMO_UNIT} in {HMO_MATRIX_DIR}. "
+            "Check your column names (e.g., '2FL (ug/mL)') and rerun metadataprocessing.ipynb."
         )
         st.stop()
 
     # ----------------------------
-    # 2) Choose ID / metadata columns to carry through the melt
-    # ----------------------------
-    ID_COLS = [c for c in ["StudyID", "SampleName", "Secretor"]
-            if c in df.columns]
-
-    # Optional: ensure the two required IDs exist
-    required = {"StudyID", "SampleName"}
-    missing = required - set(ID_COLS)
-    if missing:
-        st.error(f"Missing required columns for plotting: {missing}")
-        st.stop()
-
-    # ----------------------------
-    # 3) Reshape wide → long (melt)
-    # ----------------------------
-    plot_df = df[ID_COLS + HMO_COLS].copy()
-
-    long_df = plot_df.melt(
-        id_vars=ID_COLS,      # columns to keep (repeated down rows)
-        value_vars=HMO_COLS,  # HMO measurement columns to stack
-        var_name="HMO",       # new column that stores the HMO name
-        value_name="concentration"  # new column that stores the numeric value
-)
-    
-    # ----------------------------
-    # 4) Clean concentration + labels
-    # ----------------------------
-    long_df["concentration"] = pd.to_numeric(long_df["concentration"], errors="coerce")
-    long_df = long_df.dropna(subset=["concentration"])
-
-    # Optional: remove units from HMO label for nicer y-axis
-    long_df["HMO"] = long_df["HMO"].str.replace(f" {HMO_UNIT}", "", regex=False)
-
-    
-    # ----------------------------
-    # Add plot-friendly secretor labels
+    # 2) Row masks instead of a melted table: every filter below is a boolean mask over the matrix rows
     # ----------------------------
-    def secretor_label(x):
-        if pd.isna(x):
-            return "Unknown"
-        s = str(x).strip().lower()
-        if s in {"1", "1.0"}:
-            return "Secretor"
-        if s in {"0", "0.0"}:
-            return "Non-secretor"
-        return "Unknown"
-
-    long_df["SecretorLabel"] = long_df["Secretor"].apply(secretor_label)
+    all_rows = utils.row_mask(m)
 
     # Sanity check (temporary, remove later)
-    st.caption(long_df["SecretorLabel"].value_counts().to_dict())
+    st.caption(utils.point_counts(m, all_rows))
 
 
 
@@ -675,18 +705,14 @@ elif page == "HMO Composition":
     # ----------------------------
     st.sidebar.markdown("## Filters")
 
-    study_options = sorted(long_df["StudyID"].dropna().unique().tolist())
+    study_options = m["studies"].tolist()
     selected_studies = st.sidebar.multiselect(
         "Study",
         options=study_options,
         default=study_options
     )
 
-    plot_long = long_df[long_df["StudyID"].isin(selected_studies)].copy()
-
-
-    sel_long = long_df[long_df["StudyID"].isin(selected_studies)].copy()
-    plot_long = sel_long.copy()
+    study_rows = utils.row_mask(m, studies=selected_studies)
 
 
 
@@ -703,24 +729,8 @@ elif page == "HMO Composition":
         index=0
     )
 
-    if range_group == "All":
-        table_df = sel_long
-    else:
-        table_df = sel_long[sel_long["SecretorLabel"] == range_group].copy()
-
-    summary = (
-        table_df
-        .groupby("HMO")["concentration"]
-        .agg(
-            n="count",
-            p05=lambda x: x.quantile(0.05),
-            median="median",
-            p95=lambda x: x.quantile(0.95),
-            mean="mean",
-            std="std"
-        )
-        .reset_index()
-    )
+    # see utils.hmo_summary (served by the aggregate API when HMO_API_URL is set)
+    summary = load_aggregate("hmo_summary", study=selected_studies, secretor=range_group)
 
     display_summary = summary.copy()
     for c in ["p05", "median", "p95", "mean", "std"]:
@@ -746,11 +756,11 @@ elif page == "HMO Composition":
 
 
     # Quick sanity
-    st.caption(f"Points available to plot: {len(long_df):,}")
+    st.caption(f"Points available to plot: {sum(utils.point_counts(m, all_rows).values()):,}")
 
 
 
-    st.caption(f"Showing {plot_long.shape[0]:,} points after Study filter")
+    st.caption(f"Showing {sum(utils.point_counts(m, study_rows).values()):,} points after Study filter")
 
 
     secretor_options = ["Secretor", "Non-secretor", "Unknown"]
@@ -760,8 +770,11 @@ elif page == "HMO Composition":
         default=secretor_options
     )
 
-    plot_long = plot_long[plot_long["SecretorLabel"].isin(selected_secretors)].copy()
-    st.caption(f"Showing {plot_long.shape[0]:,} points after Secretor filter")
+    plot_rows = utils.row_mask(m, studies=selected_studies, secretors=selected_secretors)
+    st.caption(f"Showing {sum(utils.point_counts(m, plot_rows).values()):,} points after Secretor filter")
+
+    # long format only here, and only for the selected rows (plotly's strip plot needs it)
+    plot_long = utils.hmo_long(m, plot_rows)
 
 
 
@@ -797,3 +810,103 @@ elif page == "HMO Composition":
 
 
 
+
+
+
+
+
+# ----------------------------
+# --- Lactation Trends Page ---
+# ----------------------------
+# reads only the precomputed aggregates (no groupby over the full dataset here)
+
+elif page == "Lactation Trends":
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    st.markdown("## HMOs over Lactation")
+
+    try:
+        agg = load_lactation_aggregates()
+    except FileNotFoundError:
+        st.info("No lactation aggregates yet - run metadataprocessing.ipynb to build derived/hmo_lactation_aggregates.csv.")
+        st.stop()
+
+    if agg.empty:
+        st.info("No study has lactation-week information yet.")
+        st.stop()
+
+    # ---- controls ----
+    col_hmo, col_unit, col_group = st.columns(3)
+    with col_hmo:
+        hmo = st.selectbox("HMO", sorted(agg["HMO"].unique()))
+    with col_unit:
+        unit = st.selectbox("Unit", sorted(agg["unit"].unique(), reverse=True))   # ug/mL first
+    with col_group:
+        group_by = st.radio("Lines by", ["Secretor status", "Study"], horizontal=True)
+
+    st.sidebar.markdown("## Filters")
+    study_options = sorted(agg["StudyID"].unique())
+    selected_studies = st.sidebar.multiselect("Study", options=study_options, default=study_options)
+
+    sel = agg[(agg["HMO"] == hmo) & (agg["unit"] == unit) & agg["StudyID"].isin(selected_studies)]
+
+    # "Secretor status": one line per secretor group within each study; "Study": all secretors pooled
+    if group_by == "Secretor status":
+        sel = sel[sel["secretor"] != "All"].copy()
+        sel["line"] = sel["StudyID"] + " · " + sel["secretor"]
+    else:
+        sel = sel[sel["secretor"] == "All"].copy()
+        sel["line"] = sel["StudyID"]
+
+    if sel.empty:
+        st.warning("No lactation data for this selection.")
+        st.stop()
+
+    sel = sel.sort_values(["line", "week_bin_start"])
+    sel["err_plus"] = sel["ci95_high"] - sel["mean"]
+    sel["err_minus"] = sel["mean"] - sel["ci95_low"]
+
+    # ---- mean ± 95% CI per lactation-week bin ----
+    fig = px.line(
+        sel,
+        x="week_bin_start",
+        y="mean",
+        color="line",
+        markers=True,
+        error_y="err_plus",
+        error_y_minus="err_minus",
+        hover_data={"week_bin": True, "n": True, "median": ":.1f", "week_bin_start": False,
+                    "err_plus": False, "err_minus": False},
+        title=f"{hmo} over lactation (mean ± 95% CI)",
+    )
+
+    # optional: individual subject trajectories behind the means
+    show_subjects = st.checkbox("Show individual subjects", value=False)
+    if show_subjects:
+        traj = load_lactation_trajectories()
+        traj = traj[(traj["HMO"] == hmo) & (traj["unit"] == unit) & traj["StudyID"].isin(selected_studies)]
+
+        # one trace for all subjects: an empty (NaN) point after each subject breaks the line
+        gaps = traj.drop_duplicates(["StudyID", "subject_id"]).assign(lactation_week=float("nan"), concentration=float("nan"))
+        lines = pd.concat([traj, gaps]).sort_values(["StudyID", "subject_id", "lactation_week"], na_position="last")
+        fig.add_trace(go.Scatter(
+            x=lines["lactation_week"], y=lines["concentration"],
+            mode="lines", line=dict(color="rgba(150,150,150,0.25)", width=1),
+            connectgaps=False, hoverinfo="skip", showlegend=False,
+        ))
+        fig.data = fig.data[-1:] + fig.data[:-1]   # draw subject lines behind the means
+        st.caption(f"{traj.groupby(['StudyID', 'subject_id']).ngroups:,} subjects with 2+ time points")
+
+    fig.update_layout(
+        height=550,
+        legend_title="",
+        xaxis_title="Lactation week (postpartum)",
+        yaxis_title=f"Concentration ({unit})",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # ---- table of the plotted bins ----
+    display_cols = ["StudyID", "secretor", "week_bin", "n", "mean", "ci95_low", "ci95_high",
+                    "p05", "p25", "median", "p75", "p95"]
+    st.dataframe(sel[display_cols].round(2), use_container_width=True, hide_index=True)
@@ -0,0 +1,170 @@
+# ----------------------------
+# Shared aggregates
+# ----------------------------
+# used by both the Streamlit dashboard (app.py) and the local aggregate API (api.py),
+# so the numbers are the same whichever one computes them
+
+import json
+import warnings
+from pathlib import Path
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+
+
+# dashboard unit: the 19 individual HMOs in ug/mL (summary columns like SUM are not in the matrix)
+HMO_UNIT = "ug/mL"
+
+
+# plot-friendly secretor labels (1 = Secretor, 0 = Non-secretor, anything else = Unknown)
+def secretor_label(x):
+    if pd.isna(x):
+        return "Unknown"
+    s = str(x).strip().lower()
+    if s in {"1", "1.0"}:
+        return "Secretor"
+    if s in {"0", "0.0"}:
+        return "Non-secretor"
+    return "Unknown"
+
+
+# number of unique samples per study
+def study_sample_counts(df):
+    return (
+        df.groupby("StudyID")["SampleName"]
+        .nunique()
+        .reset_index(name="n_samples")
+    )
+
+
+# secretor vs non-secretor counts + proportions per study
+def secretor_composition(df):
+    comp_df = (
+        df
+        .dropna(subset=["Secretor", "StudyID"])
+        .groupby("StudyID")
+        .agg(
+            n_total=("Secretor", "count"),
+            n_secretor=("Secretor", "sum")  # since 1 = secretor, 0 = non
+        )
+        .reset_index()
+    )
+
+    comp_df["pct_secretor"] = comp_df["n_secretor"] / comp_df["n_total"]
+    comp_df["pct_non_secretor"] = 1 - comp_df["pct_secretor"]
+    return comp_df
+
+
+# ----------------------------
+# Sample x HMO matrix (derived/hmo_matrix/, written by metadataprocessing.ipynb)
+# ----------------------------
+# one float32 row per sample, one column per HMO; study / secretor / sample name arrays are row-aligned,
+# so filters are boolean row masks and stats are NumPy reductions over the masked rows
+
+# memory-map the matrix for one unit + its row arrays (nothing is copied until rows are selected)
+def load_hmo_matrix(matrix_dir, unit=HMO_UNIT):
+    matrix_dir = Path(matrix_dir)
+    manifest = json.loads((matrix_dir / "manifest.json").read_text())
+
+    def _load(name):
+        return np.load(matrix_dir / name, mmap_mode="r")
+
+    return {
+        "values": _load(manifest["units"][unit]["file"]),
+        "hmos": manifest["units"][unit]["hmos"],
+        "unit": unit,
+        "studies": np.array(manifest["studies"]),
+        "secretor_labels": np.array(manifest["secretor_labels"]),
+        "study_code": _load("study_code.npy"),
+        "secretor_code": _load("secretor_code.npy"),
+        "sample_name": _load("sample_name.npy"),
+    }
+
+
+# boolean row mask for some studies / secretor groups (None or "All" = no filter; rows without a StudyID never match)
+def row_mask(m, studies=None, secretors=None):
+    mask = np.asarray(m["study_code"]) >= 0
+    if studies is not None:
+        mask &= np.isin(m["study_code"], np.flatnonzero(np.isin(m["studies"], list(studies))))
+    if secretors is not None and secretors != "All":
+        if isinstance(secretors, str):
+            secretors = [secretors]
+        mask &= np.isin(m["secretor_code"], np.flatnonzero(np.isin(m["secretor_labels"], list(secretors))))
+    return mask
+
+
+# number of non-missing HMO values (plot points) per secretor label, for rows in mask
+def point_counts(m, mask):
+    per_row = (~np.isnan(m["values"][mask])).sum(axis=1)
+    counts = np.bincount(m["secretor_code"][mask], weights=per_row, minlength=len(m["secretor_labels"]))
+    return {str(label): int(n) for label, n in zip(m["secretor_labels"], counts)}
+
+
+# columns of the HMO summary table (also used for empty results)
+HMO_SUMMARY_COLUMNS = ["HMO", "n", "p05", "median", "p95", "mean", "std"]
+
+
+# HMO summary statistics table over the masked rows (HMOs without any value are left out)
+# no matching rows / no values at all -> empty table with the same columns
+def hmo_summary(m, mask):
+    x = np.asarray(m["values"][mask], dtype=np.float64)
+    n = (~np.isnan(x)).sum(axis=0)
+    keep = n > 0
+    if not keep.any():
+        return pd.DataFrame(columns=HMO_SUMMARY_COLUMNS)
+    x = x[:, keep]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # std of a single value -> NaN, same as pandas
+        p05, median, p95 = np.nanquantile(x, [0.05, 0.5, 0.95], axis=0)
+        summary = pd.DataFrame({
+            "HMO": np.array(m["hmos"])[keep],
+            "n": n[keep],
+            "p05": p05,
+            "median": median,
+            "p95": p95,
+            "mean": np.nanmean(x, axis=0),
+            "std": np.nanstd(x, axis=0, ddof=1),
+        })
+    return summary
+
+
+# long format (one row per sample x HMO) for the rows in mask - only for chart libraries that need it
+def hmo_long(m, mask):
+    rows = np.flatnonzero(mask)
+    x = m["values"][rows]
+    r, c = np.nonzero(~np.isnan(x))     # non-missing cells only
+    return pd.DataFrame({
+        "StudyID": m["studies"][m["study_code"][rows[r]]],
+        "SampleName": m["sample_name"][rows[r]],
+        "HMO": np.array(m["hmos"])[c],
+        "concentration": x[r, c],
+        "SecretorLabel": m["secretor_labels"][m["secretor_code"][rows[r]]],
+    })
+
+
+# ----------------------------
+# Client for the local aggregate API (api.py)
+# ----------------------------
+
+# columns of each aggregate, so empty API results (JSON []) come back as the same table shape as local ones
+AGGREGATE_COLUMNS = {
+    "study_counts": ["StudyID", "n_samples"],
+    "secretor_composition": ["StudyID", "n_total", "n_secretor", "pct_secretor", "pct_non_secretor"],
+    "hmo_summary": HMO_SUMMARY_COLUMNS,
+}
+
+
+# GET /aggregates/<name> as JSON and return it as a DataFrame
+# params: dict of query parameters; list values are sent as repeated keys (?study=A&study=B)
+# note: an empty list is dropped by urlencode (= no filter), callers handle empty selections themselves
+def fetch_aggregate(base_url, name, params=None, timeout=10):
+    query = urlencode(params or {}, doseq=True)
+    url = f"{base_url.rstrip('/')}/aggregates/{name}" + (f"?{query}" if query else "")
+    with urlopen(url, timeout=timeout) as resp:
+        df = pd.DataFrame(json.load(resp))
+    if df.empty and name in AGGREGATE_COLUMNS:
+        df = pd.DataFrame(columns=AGGREGATE_COLUMNS[name])
+    return df
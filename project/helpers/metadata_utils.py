@@ -0,0 +1,303 @@
+# ----------------------------
+# Metadata pipeline steps (used by metadataprocessing.ipynb)
+# ----------------------------
+# everything that runs per metadata workbook: read + stage, candidate column detection, core field resolution.
+# Kept in a module (not notebook cells) so run_metadata_pipeline can hand whole studies to worker processes:
+# ProcessPoolExecutor can only pickle functions that live in an importable module.
+# The keyword / token rules below are part of the notebook's cache signature - edit them here.
+
+import re
+from pathlib import Path
+
+import pandas as pd
+
+
+RAW_DIR = Path("raw")
+STAGING_DIR = Path("staging")
+
+
+# define a column-name normalizer 
+
+def normalize_col(c: str) -> str:
+    c = str(c).strip().lower()
+    c = re.sub(r"\s+", "_", c)          # spaces -> underscores
+    c = re.sub(r"[^a-z0-9_]+", "", c)   # remove weird symbols
+    c = re.sub(r"_+", "_", c)           # collapse repeated underscores
+    return c.strip("_")
+
+
+# stage one file (read + clean structure + save)
+# loads the workbook, picks a sheet, reads the data, removes truly empty rows/cols, normalizes headers, writes a staged CSV under staging/<study>,
+# returns a log row AND the cleaned frame, which stays in memory for candidate detection + core resolution (no re-read of the staged CSV)
+
+# strings pd.read_csv treats as missing by default -> the in-memory frame matches what reading the staged CSV back would give
+NA_STRINGS = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+def stage_metadata_file(rel_path: str, raw_dir: Path = RAW_DIR, staging_dir: Path = STAGING_DIR) -> tuple[dict, pd.DataFrame]:
+    src = raw_dir / rel_path
+    study_id = Path(rel_path).parts[0]
+
+    xl = pd.ExcelFile(src)                 # optionally: pd.ExcelFile(src, engine="openpyxl")
+    sheet = xl.sheet_names[0]              # ok for prototype
+
+    # Read as strings to preserve IDs exactly
+    df = xl.parse(sheet_name=sheet, dtype=str)
+
+    # Drop fully empty rows/cols
+    df = df.dropna(axis=0, how="all").dropna(axis=1, how="all")
+
+    # Normalize column names
+    df.columns = [normalize_col(c) for c in df.columns]
+
+    # Strip whitespace in all string cells (prevents join failures), missing cells stay missing
+    for c in df.columns:
+        df[c] = df[c].str.strip()
+    df = df.mask(df.isin(NA_STRINGS)).reset_index(drop=True)
+
+    out_dir = staging_dir / study_id
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    out_path = out_dir / f"metadata__{Path(rel_path).stem}__{normalize_col(sheet)}.csv"
+    df.to_csv(out_path, index=False, na_rep="nan")
+
+    log_row = {
+        "study_id": study_id,
+        "raw_rel_path": rel_path,
+        "sheet_used": sheet,
+        "n_sheets": len(xl.sheet_names),
+        "sheet_names": "|".join(xl.sheet_names),
+        "rows": df.shape[0],
+        "cols": df.shape[1],
+        "staged_csv_rel_path": str(out_path),
+        "status": "success",
+        "error": ""
+    }
+    return log_row, df
+
+
+# define keyword sets 
+
+ID_SAMPLE_KWS = [
+    "sample_id", "sampleid", "sample_name", "samplename",
+    "specimen", "aliquot", "barcode", "tube", "vial", "label"
+]
+
+ID_SUBJECT_KWS = [
+    "subject", "participant", "patient"
+]
+
+PRIORITY_META_KWS = {
+    "study_week": ["study_week", "studyweek", "visit_week", "timepoint", "wk"],
+    "maternal_age": ["maternal_age", "mat_age", "mother_age", "mom_age", "age_mom"],
+    "gestational_age_weeks": ["gestational", "ga", "gest_age", "gestation"],
+    "lactation_week_postpartum": ["postpartum", "pp", "lactation", "weeks_postpartum", "week_postpartum"]
+}
+
+
+# identify canidate columns in one staged metadata file 
+
+
+# defines a function that takes a df and returns a dictionary of results
+def identify_candidate_columns(df: pd.DataFrame) -> dict:
+    
+    # grabs the df column names and turns into a list
+    cols = df.columns.tolist()
+
+    # loops through eevery column name and keeps if any sample-keyword fro ID_SAMPLE_KWS is found as a substring
+    sample_id_candidates = [
+        c for c in cols if any(k in c for k in ID_SAMPLE_KWS)
+    ]
+
+    subject_id_candidates = [
+        c for c in cols if any(k in c for k in ID_SUBJECT_KWS)
+    ]
+
+    # builds a dictionary where each canonical priority field (e.g maternal age) maps to the list of coluns whose name contain any of the field's keywords 
+    priority_hits = {
+        canon: [c for c in cols if any(k in c for k in kws)]
+        for canon, kws in PRIORITY_META_KWS.items()
+    }
+
+    # bundles three outputs into one dictionary and returns it
+    return {
+        "sample_id_candidates": sample_id_candidates,
+        "subject_id_candidates": subject_id_candidates,
+        "priority_metadata_hits": priority_hits
+    }
+
+
+# one row of catalog/metadata_candidate_columns_log.csv for one staged metadata file
+# candidates = output of identify_candidate_columns (see above) on the in-memory frame
+
+def candidate_log_row(study_id: str, staged_csv: str, candidates: dict) -> dict:
+    # dictionary that will become one row in output log -> study id and which CSV it came from
+    row = {
+        "study_id": study_id,
+        "staged_csv": staged_csv,
+        "sample_id_candidates": ",".join(candidates["sample_id_candidates"]) or "NA",     # converts a list into a comma-separated string, or "NA" if empty
+        "subject_id_candidates": ",".join(candidates["subject_id_candidates"]) or "NA",
+    }
+
+    # one column per priority metadata field, e.g "maternal_age",hits=['mat_age', 'mother_age']
+    for canon, hits in candidates["priority_metadata_hits"].items():
+        row[canon] = ",".join(hits) if hits else "NA"
+
+    return row
+
+
+# if several columns hit the same field, pick the one whose name carries the best tokens (see pick_best_hit)
+GOOD_TOKENS = {
+    "gestational_age_weeks": ["birth", "delivery"],
+    "lactation_week_postpartum": ["postpartum", "pp"],
+}
+
+BAD_TOKENS = {
+    "gestational_age_weeks": ["baseline", "followup", "outcome", "score"],
+}
+
+def pick_best_hit(canon, hits):
+    # returns best hit, alternates, best_score
+    # if empty -> None, []
+
+    if not hits:
+        return None, []
+
+    def score(col):
+        s = 0
+        col = col.lower()
+        for t in GOOD_TOKENS.get(canon, []):
+            if t in col: s += 3
+        for t in BAD_TOKENS.get(canon, []):
+            if t in col: s -= 3
+        return s
+
+    ranked = sorted(hits, key=score, reverse=True)
+    best = ranked[0]
+    best_score = score(best)
+    alts = ranked[1:]
+    return best, alts, best_score
+
+
+# resolve the core metadata columns of one staged file (in memory)
+# returns the core dataframe (one column per canonical field + subject_id / hmo_sample_name) and the resolution log rows
+
+def resolve_core_metadata(df: pd.DataFrame, candidates: dict, study_id: str, staged_csv: str) -> tuple[pd.DataFrame, list[dict]]:
+    core_row = {}
+    resolution_log = {}
+
+    # ---- YOUR EXISTING LOGIC (unchanged) ----
+    for canon, hits in candidates["priority_metadata_hits"].items():
+        if len(hits) == 1:
+            core_row[canon] = df[hits[0]]
+            resolution_log[canon] = {
+                "selected": hits[0],
+                "reason": "single_hit"
+            }
+
+        elif len(hits) > 1:
+            best, alts, best_score = pick_best_hit(canon, hits)
+            core_row[canon] = df[best] if best else pd.NA
+            resolution_log[canon] = {
+                "selected": best,
+                "alternates": alts,
+                "reason": "token_scoring"
+            }
+
+        else:
+            core_row[canon] = pd.NA
+            resolution_log[canon] = {
+                "selected": None,
+                "reason": "not_found"
+            }
+
+# ---------- SECTION (ID COLUMNS) ----------
+    sub_hits = candidates.get("subject_id_candidates", [])
+    samp_hits = candidates.get("sample_id_candidates", [])
+
+    subject_col = sub_hits[0] if len(sub_hits) > 0 else None
+    sample_col  = samp_hits[0] if len(samp_hits) > 0 else None
+
+    core_row["subject_id"] = df[subject_col] if subject_col else pd.NA
+    core_row["hmo_sample_name"] = df[sample_col] if sample_col else pd.NA
+
+    resolution_log["subject_id"] = {
+        "selected": subject_col,
+        "alternates": sub_hits[1:] if len(sub_hits) > 1 else [],
+        "reason": "id_candidate_first"
+    }
+
+    resolution_log["hmo_sample_name"] = {
+        "selected": sample_col,
+        "alternates": samp_hits[1:] if len(samp_hits) > 1 else [],
+        "reason": "id_candidate_first"
+    }
+
+
+    # ----------------------------------------
+
+    # build core dataframe (index = staged rows, so fields that were not found are still one value per row)
+    core_df = pd.DataFrame(core_row, index=df.index)
+
+    resolution_rows = [
+        {
+            "study_id": study_id,
+            "staged_csv": staged_csv,
+            "canonical_field": field,
+            "selected_column": info.get("selected"),
+            "alternates": ",".join(info.get("alternates", [])),
+            "reason": info.get("reason")
+        }
+        for field, info in resolution_log.items()
+    ]
+    return core_df, resolution_rows
+
+
+# stage -> candidates -> core resolution -> core CSV for one workbook, all on the same in-memory frame
+def process_metadata_file(rel_path: str, raw_dir: Path = RAW_DIR, staging_dir: Path = STAGING_DIR) -> dict:
+    stage_row, df = stage_metadata_file(rel_path, raw_dir, staging_dir)
+    study_id = stage_row["study_id"]
+    staged_csv = stage_row["staged_csv_rel_path"]
+
+    candidates = identify_candidate_columns(df)
+    core_df, resolution_rows = resolve_core_metadata(df, candidates, study_id, staged_csv)
+
+    # save per-study core metadata
+    out_path = staging_dir / study_id / f"metadata__core_cleaned_{study_id}.csv"
+    core_df.to_csv(out_path, index=False)
+
+    return {
+        "stage": [stage_row],
+        "candidates": [candidate_log_row(study_id, staged_csv, candidates)],
+        "resolution": resolution_rows,
+        "core_output": [{"study_id": study_id, "core_output": str(out_path)}],
+        "core_df": core_df,
+    }
+
+
+# worker for one study: its workbooks in order (they share the study's core output path)
+# top-level in this module so ProcessPoolExecutor can pickle it; failures are captured per file without killing the run
+def process_study_metadata(files: list[str], raw_dir: Path = RAW_DIR, staging_dir: Path = STAGING_DIR) -> list[dict]:
+    results = []
+    for rel_path in files:
+        try:
+            result = {**process_metadata_file(rel_path, raw_dir, staging_dir), "status": "processed"}
+        except Exception as e:
+            result = {
+                "stage": [{
+                    "study_id": Path(rel_path).parts[0],
+                    "raw_rel_path": rel_path,
+                    "sheet_used": "",
+                    "rows": None,
+                    "cols": None,
+                    "staged_csv_rel_path": "",
+                    "status": "failed",
+                    "error": str(e)
+                }],
+                "candidates": [], "resolution": [], "core_output": [], "core_df": None,
+                "status": "failed",
+            }
+        results.append(result)
+    return results